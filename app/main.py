@@ -1,20 +1,80 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, HttpUrl, validator
 from starlette.requests import Request
+from playwright.async_api import async_playwright
 from datetime import datetime
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Literal, Optional, Tuple
+from urllib.parse import urlparse
+import asyncio
+import httpx
 import logging
+import multiprocessing
+import os
+import time
 
 from app.scraper.static_scraper import StaticScraper
 from app.scraper.js_scraper import JSScraper
+from app.scraper.models import ScrapeResult
+from app.utils.dns import caching_transport
 from app.utils.errors import ScraperError
+from app.utils.pool import RestartingProcessPool
+from app.utils.url import normalize_url
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Universal Website Scraper")
+SITE_KIND_TTL = 3600.0  # Seconds before a host's scraper choice is re-checked
+SITE_KIND_CACHE_SIZE = 10_000  # Hosts remembered, least recently used evicted first
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Launch one headless browser, a bound on concurrent JS scrapes and a parse pool"""
+    # Spawned (not forked) workers, since the parent runs threads and the Playwright driver.
+    # Shared by both scrapers, so a crashed worker is replaced rather than breaking every scrape
+    app.state.parse_pool = RestartingProcessPool(
+        max_workers=os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    # One pooled HTTP/2 client (with cached DNS lookups) for static fetches and skill replay.
+    # Its cookie jar accepts nothing, so one user's Set-Cookie never reaches another's scrape
+    app.state.http = httpx.AsyncClient(
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+        transport=caching_transport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128, keepalive_expiry=30.0)
+        ),
+        timeout=15.0
+    )
+    app.state.static_scraper = StaticScraper(app.state.http, app.state.parse_pool)
+    app.state.playwright = await async_playwright().start()
+    app.state.browser = await app.state.playwright.chromium.launch(headless=True)
+    concurrency = int(os.getenv("SCRAPE_CONCURRENCY", "4"))
+    # Shared JS scraper so per-domain skills survive across requests
+    app.state.js_scraper = JSScraper(app.state.browser, app.state.parse_pool, app.state.http)
+    # Per-host record of which scraper produced usable content: host -> (expires_at, "static" or "js")
+    app.state.site_kind: "OrderedDict[str, Tuple[float, Literal['static', 'js']]]" = OrderedDict()
+    
+    # Each JS scrape gets its own fresh context; this caps how many are open at once
+    app.state.js_slots = asyncio.Semaphore(concurrency)
+    logger.info(f"Browser launched for up to {concurrency} concurrent JS scrapes")
+    
+    yield
+    
+    await app.state.browser.close()
+    await app.state.playwright.stop()
+    app.state.parse_pool.shutdown(cancel_futures=True)
+    await app.state.http.aclose()
+    logger.info("Browser closed")
+
+
+app = FastAPI(title="Universal Website Scraper", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -45,7 +105,39 @@ async def health_check():
     return {"status": "ok"}
 
 
-@app.post("/scrape")
+def text_size(result: ScrapeResult) -> int:
+    """Total section text length of a scrape result"""
+    return sum(len(section.get('text', '')) for section in result.sections)
+
+
+def get_site_kind(host: str) -> Optional[str]:
+    """Scraper that last worked for host, or None if unknown or expired"""
+    entry = app.state.site_kind.get(host)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del app.state.site_kind[host]
+        return None
+    app.state.site_kind.move_to_end(host)
+    return entry[1]
+
+
+def remember_site_kind(host: str, kind: Literal["static", "js"]):
+    """Record which scraper worked for host, evicting the least recently used host when full"""
+    app.state.site_kind[host] = (time.monotonic() + SITE_KIND_TTL, kind)
+    app.state.site_kind.move_to_end(host)
+    if len(app.state.site_kind) > SITE_KIND_CACHE_SIZE:
+        app.state.site_kind.popitem(last=False)
+
+
+async def scrape_js(url: str) -> ScrapeResult:
+    """Render url in a fresh browser context, waiting for a slot (the semaphore bounds concurrency)"""
+    # A new context per scrape: storage, service workers and permissions never carry over between users
+    async with app.state.js_slots:
+        return await app.state.js_scraper.scrape(url)
+
+
+@app.post("/scrape", response_class=ORJSONResponse)
 async def scrape(request: ScrapeRequest):
     """
     Scrape a website and return structured JSON.
@@ -53,28 +145,43 @@ async def scrape(request: ScrapeRequest):
     """
     try:
         logger.info(f"Scraping URL: {request.url}")
+        host = urlparse(normalize_url(request.url)).netloc.lower()
+        site_kind = get_site_kind(host)
+        
+        # Hosts known to need rendering skip the static attempt
+        if site_kind == "js":
+            logger.info(f"Known JS site {host}, using JS rendering")
+            result = await scrape_js(request.url)
+            result.scrapedAt = datetime.utcnow().isoformat() + 'Z'
+            return ORJSONResponse(content={"result": result})
         
         # Try static scraping first
-        static_scraper = StaticScraper()
-        result = await static_scraper.scrape(request.url)
+        static_scraper = app.state.static_scraper
+        static_result = await static_scraper.scrape(request.url)
         
-        # Check if static scraping was sufficient
-        if static_scraper.is_sufficient(result):
+        # Check if static scraping was sufficient (known static hosts skip the check unless they came back empty)
+        known_static = site_kind == "static" and text_size(static_result) > 0
+        if known_static or static_scraper.is_sufficient(static_result):
             logger.info("Static scraping successful")
-            result['scrapedAt'] = datetime.utcnow().isoformat() + 'Z'
-            return JSONResponse(content={"result": result})
+            if not known_static:
+                remember_site_kind(host, "static")
+            static_result.scrapedAt = datetime.utcnow().isoformat() + 'Z'
+            return ORJSONResponse(content={"result": static_result})
         
         # Fall back to JS rendering
         logger.info("Static scraping insufficient, using JS rendering")
-        js_scraper = JSScraper()
-        result = await js_scraper.scrape(request.url)
-        result['scrapedAt'] = datetime.utcnow().isoformat() + 'Z'
+        result = await scrape_js(request.url)
+        result.scrapedAt = datetime.utcnow().isoformat() + 'Z'
+        
+        # Remember whether rendering actually found more content than static HTML
+        js_won = text_size(result) > text_size(static_result)
+        remember_site_kind(host, "js" if js_won else "static")
         
-        return JSONResponse(content={"result": result})
+        return ORJSONResponse(content={"result": result})
         
     except ScraperError as e:
         logger.error(f"Scraper error: {str(e)}")
-        return JSONResponse(
+        return ORJSONResponse(
             content={
                 "result": {
                     "url": request.url,
@@ -1,18 +1,119 @@
-from playwright.async_api import Page
+from playwright.async_api import ElementHandle, JSHandle, Page
 import logging
-from typing import List, Dict, Any
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Pattern, Tuple
+
+from app.scraper.models import Interactions
 
 logger = logging.getLogger(__name__)
 
+# Visibility check shared by the lookup scripts below (close to Playwright's is_visible)
+_IS_VISIBLE_JS = '''
+    const isVisible = (el) => el.getClientRects().length > 0 &&
+        window.getComputedStyle(el).visibility !== 'hidden';
+'''
+
+# Returns {element, index} for the first visible element matching a [css, text] target
+# (text is a case-insensitive substring of innerText), or {element: null}
+FIND_FIRST_VISIBLE_JS = '''
+    (targets) => {''' + _IS_VISIBLE_JS + '''
+        for (let index = 0; index < targets.length; index++) {
+            const [css, text] = targets[index];
+            for (const el of document.querySelectorAll(css)) {
+                if (!isVisible(el)) continue;
+                if (text && !(el.innerText || '').toLowerCase().includes(text)) continue;
+                return {element: el, index};
+            }
+        }
+        return {element: null, index: -1};
+    }
+'''
+
+# Scrolls to the bottom, then resolves with the page height as soon as a DOM mutation
+# grows it past oldHeight, or after cap milliseconds
+SCROLL_AND_WAIT_JS = '''
+    ([oldHeight, cap]) => new Promise(resolve => {
+        const done = () => {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(document.body.scrollHeight);
+        };
+        const observer = new MutationObserver(() => {
+            if (document.body.scrollHeight > oldHeight) done();
+        });
+        observer.observe(document.body, {childList: true, subtree: true});
+        const timer = setTimeout(done, cap);
+        window.scrollTo(0, document.body.scrollHeight);
+    })
+'''
+
+# Returns {clickables, matches}: every link/button in document order, plus the first
+# visible element (or null) for each CSS selector, keyed by selector
+PAGINATION_CANDIDATES_JS = '''
+    (selectors) => {''' + _IS_VISIBLE_JS + '''
+        const matches = {};
+        for (const selector of selectors) {
+            matches[selector] = Array.from(document.querySelectorAll(selector)).find(isVisible) || null;
+        }
+        return {clickables: Array.from(document.querySelectorAll('a, button')), matches};
+    }
+'''
+
+# Serializable view of PAGINATION_CANDIDATES_JS: [tag, visible, text] per clickable
+# and whether each selector matched
+PAGINATION_INFO_JS = '''
+    ({clickables, matches}) => {''' + _IS_VISIBLE_JS + '''
+        return {
+            clickables: clickables.map(el => [
+                el.tagName.toLowerCase(),
+                isVisible(el),
+                (el.innerText || '').trim().slice(0, 100)
+            ]),
+            matches: Object.fromEntries(
+                Object.entries(matches).map(([selector, el]) => [selector, el !== null])
+            )
+        };
+    }
+'''
+
+# Returns {selector, tabs: [{index, visible, text}]} for the first selector
+# matching any element (up to 5 tabs), or null
+FIND_TABS_JS = '''
+    (selectors) => {''' + _IS_VISIBLE_JS + '''
+        for (const selector of selectors) {
+            const els = Array.from(document.querySelectorAll(selector)).slice(0, 5);
+            if (els.length) {
+                return {
+                    selector,
+                    tabs: els.map((el, index) => ({
+                        index,
+                        visible: isVisible(el),
+                        text: (el.innerText || '').trim().slice(0, 50)
+                    }))
+                };
+            }
+        }
+        return null;
+    }
+'''
+
 
 class InteractionHandler:
     """Handle page interactions: clicks, scrolls, pagination"""
     
-    def __init__(self, page: Page):
+    # Compiled text matchers replacing Playwright's :has-text() (case-insensitive substring)
+    NEXT_TEXT_RE = re.compile(r'next', re.IGNORECASE)
+    ARROW_TEXT_RE = re.compile(r'>')
+    
+    def __init__(self, page: Page, remove_noise: Optional[Callable[[Page], Awaitable[Any]]] = None):
         self.page = page
+        # Run on each page reached through pagination before it is read
+        self.remove_noise = remove_noise
         self.clicks = []
         self.scrolls = 0
         self.pages = []
+        self.tab_html: List[str] = []  # HTML snapshots of each clicked tab
+        self.page_html: List[Tuple[int, str]] = []  # (pageNumber, rendered HTML) of each page left via pagination
     
     async def perform_interactions(self, max_depth: int = 3):
         """
@@ -25,7 +126,29 @@ class InteractionHandler:
         await self._handle_pagination(max_depth)
     
     async def _handle_tabs(self):
-        """Click on tabs to reveal hidden content"""
+        """
+        Click tabs to reveal hidden content.
+        The page's HTML is snapshotted after each click,
+        since clicking one tab usually hides the content of the others.
+        """
+        for selector, idx, text in await self._collect_tabs():
+            try:
+                await self.page.locator(selector).nth(idx).click(timeout=2000)
+                await self.page.wait_for_timeout(500)
+                self.tab_html.append(await self.page.content())
+            except Exception as e:
+                logger.debug(f"Failed to click tab {idx}: {str(e)}")
+                continue
+            
+            self.clicks.append({
+                "type": "tab",
+                "selector": selector,
+                "text": text
+            })
+            logger.info(f"Clicked tab: {text[:30]}")
+    
+    async def _collect_tabs(self) -> List[Tuple[str, int, str]]:
+        """Find up to 5 visible tabs as (selector, index, text) without clicking"""
         tab_selectors = [
             '[role="tab"]',
             '.tab',
@@ -34,80 +157,66 @@ class InteractionHandler:
             'a[data-toggle="tab"]'
         ]
         
-        for selector in tab_selectors:
-            try:
-                tabs = await self.page.locator(selector).all()
-                
-                for idx, tab in enumerate(tabs[:5]):  # Limit to 5 tabs
-                    try:
-                        if await tab.is_visible():
-                            text = await tab.inner_text()
-                            await tab.click(timeout=2000)
-                            await self.page.wait_for_timeout(500)
-                            
-                            self.clicks.append({
-                                "type": "tab",
-                                "selector": selector,
-                                "text": text.strip()[:50]
-                            })
-                            logger.info(f"Clicked tab: {text.strip()[:30]}")
-                    except Exception as e:
-                        logger.debug(f"Failed to click tab {idx}: {str(e)}")
-                        continue
-                
-                if tabs:
-                    break  # Stop after finding tabs
-                    
-            except Exception as e:
-                logger.debug(f"No tabs found with selector {selector}")
-                continue
+        try:
+            # One round-trip: first selector with matches, plus visibility/text of its tabs
+            match = await self.page.evaluate(FIND_TABS_JS, tab_selectors)
+        except Exception as e:
+            logger.debug(f"Failed to look up tabs: {str(e)}")
+            return []
+        
+        if not match:
+            return []
+        
+        return [
+            (match['selector'], tab['index'], tab['text'])
+            for tab in match['tabs'] if tab['visible']
+        ]
     
     async def _handle_load_more(self):
         """Click "Load more" / "Show more" buttons"""
-        load_more_selectors = [
-            'button:has-text("Load more")',
-            'button:has-text("Show more")',
-            'button:has-text("View more")',
-            'a:has-text("Load more")',
-            '[class*="load-more"]',
-            '[class*="show-more"]',
-            'button[class*="more"]'
+        # (selector label, CSS selector, required text)
+        load_more_targets = [
+            ('button:has-text("Load more")', 'button', 'load more'),
+            ('button:has-text("Show more")', 'button', 'show more'),
+            ('button:has-text("View more")', 'button', 'view more'),
+            ('a:has-text("Load more")', 'a', 'load more'),
+            ('[class*="load-more"]', '[class*="load-more"]', None),
+            ('[class*="show-more"]', '[class*="show-more"]', None),
+            ('button[class*="more"]', 'button[class*="more"]', None)
         ]
+        # Indexes into load_more_targets still worth trying; narrowed to the first target
+        # that produces a click, so a vanished "Load more" never falls through to e.g. "Read more"
+        active = list(range(len(load_more_targets)))
         
         clicks_performed = 0
         max_clicks = 3
         
-        for selector in load_more_selectors:
+        while clicks_performed < max_clicks:
             try:
-                while clicks_performed < max_clicks:
-                    try:
-                        button = self.page.locator(selector).first
-                        
-                        if await button.is_visible(timeout=1000):
-                            text = await button.inner_text()
-                            await button.click(timeout=2000)
-                            await self.page.wait_for_timeout(1000)
-                            
-                            self.clicks.append({
-                                "type": "load_more",
-                                "selector": selector,
-                                "text": text.strip()[:50]
-                            })
-                            clicks_performed += 1
-                            logger.info(f"Clicked load more: {text.strip()[:30]}")
-                        else:
-                            break
-                            
-                    except Exception as e:
-                        logger.debug(f"Load more button not found or clickable: {str(e)}")
-                        break
+                # One round-trip finds the first visible button across the active selectors
+                targets = [load_more_targets[i][1:] for i in active]
+                handle = await self.page.evaluate_handle(FIND_FIRST_VISIBLE_JS, targets)
+                button = (await handle.get_property('element')).as_element()
+                if not button:
+                    break
+                
+                target_index = active[await (await handle.get_property('index')).json_value()]
+                text = await button.inner_text()
+                await button.click(timeout=2000)
+                await self.page.wait_for_timeout(1000)
+                
+                self.clicks.append({
+                    "type": "load_more",
+                    "selector": load_more_targets[target_index][0],
+                    "text": text.strip()[:50]
+                })
+                clicks_performed += 1
+                active = [target_index]
+                logger.info(f"Clicked load more: {text.strip()[:30]}")
                 
-                if clicks_performed > 0:
-                    break  # Stop after finding working button
-                    
             except Exception as e:
-                logger.debug(f"No load more button found with selector {selector}")
-                continue
+                logger.debug(f"Load more button not found or clickable: {str(e)}")
+                break
     
     async def _handle_infinite_scroll(self):
         """Perform infinite scrolling to load more content"""
@@ -117,12 +226,8 @@ class InteractionHandler:
             max_scrolls = 3
             
             while scroll_attempts < max_scrolls:
-                # Scroll to bottom
-                await self.page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-                await self.page.wait_for_timeout(1500)
-                
-                # Check if new content loaded
-                new_height = await self.page.evaluate('document.body.scrollHeight')
+                # Scroll to bottom and wait until new content grows the page (at most 1.5s)
+                new_height = await self.page.evaluate(SCROLL_AND_WAIT_JS, [previous_height, 1500])
                 
                 if new_height > previous_height:
                     self.scrolls += 1
@@ -137,28 +242,40 @@ class InteractionHandler:
     
     async def _handle_pagination(self, max_depth: int = 3):
         """Follow pagination links to scrape multiple pages"""
-        pagination_selectors = [
-            'a:has-text("Next")',
-            'a:has-text(">")',
-            '[rel="next"]',
-            '.pagination a:last-child',
-            '[class*="next"]',
-            'button:has-text("Next")'
+        # (selector label, tag, text pattern); entries without a pattern are plain CSS
+        pagination_targets = [
+            ('a:has-text("Next")', 'a', self.NEXT_TEXT_RE),
+            ('a:has-text(">")', 'a', self.ARROW_TEXT_RE),
+            ('[rel="next"]', None, None),
+            ('.pagination a:last-child', None, None),
+            ('[class*="next"]', None, None),
+            ('button:has-text("Next")', 'button', self.NEXT_TEXT_RE)
         ]
         
+        css_selectors = [selector for selector, _, pattern in pagination_targets if pattern is None]
+        
         current_page = 1
         visited_urls = set([self.page.url])
         
         while current_page < max_depth:
             next_clicked = False
             
-            for selector in pagination_selectors:
+            try:
+                # Two round-trips per page: candidate handles, then their tags/visibility/text.
+                # Text targets are matched in Python
+                candidates = await self.page.evaluate_handle(PAGINATION_CANDIDATES_JS, css_selectors)
+                candidate_info = await candidates.evaluate(PAGINATION_INFO_JS)
+            except Exception as e:
+                logger.debug(f"Failed to read pagination candidates: {str(e)}")
+                break
+            
+            for selector, tag, pattern in pagination_targets:
                 try:
-                    next_button = self.page.locator(selector).first
+                    next_button = await self._find_target(selector, tag, pattern, candidates, candidate_info)
                     
-                    if await next_button.is_visible(timeout=1000):
-                        # Get URL before clicking
-                        href = await next_button.get_attribute('href') or ""
+                    if next_button:
+                        # Snapshot the rendered page (with its tabs/load-more/scroll content) before leaving it
+                        snapshot = await self.page.content()
                         
                         await next_button.click(timeout=2000)
                         await self.page.wait_for_load_state('networkidle', timeout=5000)
@@ -168,7 +285,10 @@ class InteractionHandler:
                         # Check if we actually navigated to a new page
                         if new_url not in visited_urls:
                             visited_urls.add(new_url)
+                            self.page_html.append((current_page, snapshot))
                             current_page += 1
+                            if self.remove_noise:
+                                await self.remove_noise(self.page)
                             
                             self.pages.append({
                                 "pageNumber": current_page,
@@ -188,10 +308,21 @@ class InteractionHandler:
             if not next_clicked:
                 break
     
-    def get_interaction_summary(self) -> Dict[str, Any]:
+    async def _find_target(self, selector: str, tag: Optional[str], pattern: Optional[Pattern[str]],
+                           candidates: JSHandle, candidate_info: Dict[str, Any]) -> Optional[ElementHandle]:
+        """Return the first visible element of a target, or None"""
+        if pattern is None:
+            if not candidate_info['matches'].get(selector):
+                return None
+            matches = await candidates.get_property('matches')
+            return (await matches.get_property(selector)).as_element()
+        
+        for idx, (el_tag, visible, text) in enumerate(candidate_info['clickables']):
+            if visible and el_tag == tag and pattern.search(text):
+                clickables = await candidates.get_property('clickables')
+                return (await clickables.get_property(str(idx))).as_element()
+        return None
+    
+    def get_interaction_summary(self) -> Interactions:
         """Return summary of all interactions performed"""
-        return {
-            "clicks": self.clicks,
-            "scrolls": self.scrolls,
-            "pages": self.pages
-        }
+        return Interactions(clicks=self.clicks, scrolls=self.scrolls, pages=self.pages)
@@ -1,99 +1,339 @@
-from playwright.async_api import async_playwright, Browser, Page
-from bs4 import BeautifulSoup
-from typing import Dict, Any
+from playwright.async_api import Browser, BrowserContext, Page, Response, Route
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Dict, Any, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+import asyncio
+import httpx
 import logging
+import re
 
-from app.scraper.section_parser import SectionParser
+from app.scraper.section_parser import SectionParser, parse_html
 from app.scraper.interactions import InteractionHandler
-from app.utils.errors import JSRenderError
+from app.scraper.models import ScrapeResult
+from app.utils.errors import JSRenderError, ParsingError
 from app.utils.url import normalize_url
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_worker(html: str, url: str) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """Parse rendered HTML into (meta, sections); module-level so process pools can pickle it"""
+    tree = parse_html(html)
+    parser = SectionParser(url)
+    return parser.extract_meta(tree), parser.parse_sections(tree)
+
+
 class JSScraper:
-    """JavaScript-enabled scraper using Playwright"""
+    """
+    JavaScript-enabled scraper using Playwright.
+    Renders pages in contexts on a long-lived shared browser.
+    """
     
     TIMEOUT = 30000  # 30 seconds
     WAIT_STRATEGIES = ['networkidle', 'domcontentloaded']
+    SETTLE_TIMEOUT = 2000  # Extra wait for JS execution after content appears
+    MAX_HTML_CHARS = 10 * 1024 * 1024  # Rendered HTML beyond this is cut before parsing, like the static byte cap
+    MIN_API_BODY = 1024  # Minimum JSON body size to record as a skill endpoint
+    MIN_API_OVERLAP = 0.5  # Share of an endpoint's words that must appear in the rendered sections
+    MIN_API_COVERAGE = 0.25  # Share of the rendered sections' words the endpoint must supply
+    SKILL_CACHE_SIZE = 1024  # Hosts (selectors) and page URLs (endpoints) remembered for skills
+    WORD_RE = re.compile(r'\w{3,}')
+    CONTENT_SELECTORS = ['main', 'article', '[role="main"]', 'body']
+    # Images/media/fonts are never rendered into the result; <img src> survives in the HTML.
+    # Stylesheets still load: noise removal and visibility checks rely on computed styles.
+    BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font'})
+    TRACKER_HOSTS_RE = re.compile(
+        r'(^|\.)('
+        r'google-analytics\.com|googletagmanager\.com|doubleclick\.net|googlesyndication\.com|'
+        r'facebook\.net|connect\.facebook\.com|hotjar\.com|segment\.(com|io)|mixpanel\.com|'
+        r'scorecardresearch\.com|quantserve\.com|criteo\.(com|net)|taboola\.com|outbrain\.com|'
+        r'nr-data\.net|clarity\.ms|amplitude\.com|adsrvr\.org'
+        r')$'
+    )
+    NOISE_SELECTOR = ','.join([
+        '[class*="cookie"]',
+        '[id*="cookie"]',
+        '[class*="consent"]',
+        '[id*="consent"]',
+        '[class*="gdpr"]',
+        '[role="dialog"][class*="modal"]',
+        '[class*="banner"]',
+        '[class*="popup"]',
+        '.modal.show',
+        '[style*="position: fixed"]'
+    ])
+    
+    def __init__(self, browser: Browser, parse_pool: Optional[Executor] = None,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        self.browser = browser
+        # CPU-bound HTML parsing runs here so it doesn't block the event loop
+        self.parse_pool = parse_pool
+        # Used for skill replay; pass the app's shared client to reuse its connections
+        self._owns_client = http_client is None
+        self.http_client = http_client or httpx.AsyncClient()
+        # Skills learned on previous renders, each an LRU of at most SKILL_CACHE_SIZE entries:
+        # host -> content selectors that matched, page URL -> {"api", "headers", "schema", "meta"}
+        self._selector_cache: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._api_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
     
-    async def scrape(self, url: str) -> Dict[str, Any]:
+    async def close(self):
+        """Close the HTTP client if this scraper created it"""
+        if self._owns_client:
+            await self.http_client.aclose()
+    
+    async def new_context(self) -> BrowserContext:
+        """
+        Create a browser context with the scraper's user agent and viewport
+        that skips media downloads and known trackers
+        """
+        context = await self.browser.new_context(
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            viewport={'width': 1920, 'height': 1080}
+        )
+        await context.route("**/*", self._route_request)
+        return context
+    
+    async def _route_request(self, route: Route):
+        """Abort requests whose bytes never reach the parser"""
+        request = route.request
+        if request.resource_type in self.BLOCKED_RESOURCE_TYPES or \
+                self.TRACKER_HOSTS_RE.search(urlparse(request.url).hostname or ''):
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    async def scrape(self, url: str) -> ScrapeResult:
+        """
+        Scrape website using headless browser with JS rendering
+        in a fresh context on the shared browser.
         """
-        Scrape website using headless browser with JS rendering.
+        context = None
+        try:
+            context = await self.new_context()
+            return await self.scrape_with_context(context, url)
+        except JSRenderError:
+            raise
+        except Exception as e:
+            logger.error(f"JS rendering error: {str(e)}")
+            raise JSRenderError(f"Failed to render page: {str(e)}")
+        finally:
+            if context:
+                await context.close()
+    
+    async def scrape_with_context(self, context: BrowserContext, url: str) -> ScrapeResult:
+        """
+        Scrape website using headless browser with JS rendering in a pre-made context.
         Includes interactions: clicks, scrolls, pagination.
+        Replays a previously recorded JSON endpoint instead when one is cached.
+        The context is left open; every page opened here is closed.
         """
         normalized_url = normalize_url(url)
-        browser = None
+        host = urlparse(normalized_url).netloc.lower()
+        
+        cached = await self._replay_skill(normalized_url)
+        if cached is not None:
+            return cached
+        
+        page = None
         
         try:
             logger.info(f"Starting JS rendering for: {normalized_url}")
             
-            async with async_playwright() as p:
-                # Launch browser
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    viewport={'width': 1920, 'height': 1080}
-                )
-                
-                page = await context.new_page()
-                page.set_default_timeout(self.TIMEOUT)
-                
-                # Navigate to URL
-                await page.goto(normalized_url, wait_until='domcontentloaded')
-                
-                # Wait for content using multiple strategies
-                await self._wait_for_content(page)
-                
-                # Remove noise elements
-                await self._remove_noise(page)
-                
-                # Perform interactions
-                interaction_handler = InteractionHandler(page)
-                await interaction_handler.perform_interactions(max_depth=3)
-                
-                # Get final HTML
-                html_content = await page.content()
-                
-                # Parse with BeautifulSoup
-                soup = BeautifulSoup(html_content, 'lxml')
-                
-                # Initialize parser
-                parser = SectionParser(normalized_url)
-                
-                # Extract meta and sections
-                meta = parser.extract_meta(soup)
-                sections = parser.parse_sections(soup)
-                
-                # Get interaction summary
-                interactions = interaction_handler.get_interaction_summary()
-                
-                result = {
-                    "url": normalized_url,
-                    "meta": meta,
-                    "sections": sections,
-                    "interactions": interactions,
-                    "errors": []
-                }
-                
-                logger.info(f"JS scraping completed: {len(sections)} sections, {len(interactions['clicks'])} clicks, {interactions['scrolls']} scrolls, {len(interactions['pages'])} pages")
-                
-                await browser.close()
-                return result
+            page = await context.new_page()
+            page.set_default_timeout(self.TIMEOUT)
+            
+            # Record JSON XHR/fetch responses as skill candidates
+            api_responses: List[Response] = []
+            page.on("response", lambda response: self._record_response(response, api_responses))
+            
+            # Navigate to URL
+            await page.goto(normalized_url, wait_until='domcontentloaded')
+            
+            # Wait for content, let late JS run, then remove noise
+            content_selector = await self._settle(page, self._selector_cache.get(host))
+            
+            # Perform interactions
+            interaction_handler = InteractionHandler(page, remove_noise=self._remove_noise)
+            await interaction_handler.perform_interactions(max_depth=3)
+            
+            # Get final HTML
+            html_content = await page.content()
+            
+            # Parse the page and every tab and earlier-page snapshot concurrently, off the event loop
+            snapshots = interaction_handler.tab_html + [html for _, html in interaction_handler.page_html]
+            (meta, sections), *snapshot_results = await asyncio.gather(
+                self._parse(html_content, normalized_url),
+                *[self._parse(html, normalized_url) for html in snapshots]
+            )
+            tab_count = len(interaction_handler.tab_html)
+            
+            # Add content revealed by each tab
+            for tab_idx, (_, tab_sections) in enumerate(snapshot_results[:tab_count]):
+                self._merge_sections(sections, tab_sections, f"tab-{tab_idx}")
+            
+            # Add content from pages left through pagination (the page it ended on is parsed above)
+            for (page_number, _), (_, page_sections) in zip(interaction_handler.page_html, snapshot_results[tab_count:]):
+                self._merge_sections(sections, page_sections, f"page-{page_number}")
+            
+            # Get interaction summary
+            interactions = interaction_handler.get_interaction_summary()
+            
+            await self._learn_skill(host, normalized_url, meta, sections, content_selector, api_responses)
+            
+            result = ScrapeResult(url=normalized_url, meta=meta, sections=sections, interactions=interactions)
+            
+            logger.info(f"JS scraping completed: {len(sections)} sections, {len(interactions.clicks)} clicks, {interactions.scrolls} scrolls, {len(interactions.pages)} pages")
+            
+            return result
                 
         except Exception as e:
-            if browser:
-                await browser.close()
             logger.error(f"JS rendering error: {str(e)}")
             raise JSRenderError(f"Failed to render page: {str(e)}")
+        finally:
+            if page:
+                await page.close()
+    
+    async def _parse(self, html: str, url: str) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+        """Run _parse_worker in the parse pool (or the default executor without one)"""
+        if len(html) > self.MAX_HTML_CHARS:
+            # Keep oversized DOMs from being pickled whole and from exhausting a worker's memory
+            logger.warning(f"Rendered HTML of {len(html)} chars truncated to {self.MAX_HTML_CHARS}")
+            html = html[:self.MAX_HTML_CHARS]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.parse_pool, _parse_worker, html, url)
+    
+    def _merge_sections(self, sections: List[Dict[str, Any]], extra: List[Dict[str, Any]], prefix: str):
+        """Append sections from extra that are not already present"""
+        seen = {(section['heading'], section['text']) for section in sections}
+        for section in extra:
+            key = (section['heading'], section['text'])
+            if key not in seen:
+                seen.add(key)
+                sections.append(dict(section, id=f"{prefix}-{section['id']}"))
+    
+    def _remember(self, cache: OrderedDict, key: str, value: Any):
+        """Store value in an LRU skill cache, evicting the least recently used entry when full"""
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.SKILL_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    async def _replay_skill(self, url: str) -> Optional[ScrapeResult]:
+        """
+        Fetch a cached JSON endpoint for url directly with httpx.
+        Returns None on cache miss, fetch failure or schema mismatch.
+        """
+        api = self._api_cache.get(url)
+        if not api:
+            return None
+        self._api_cache.move_to_end(url)
+        
+        try:
+            response = await self.http_client.get(
+                api['api'],
+                headers=api['headers'],
+                timeout=self.TIMEOUT / 1000,
+                follow_redirects=True
+            )
+            response.raise_for_status()
+            data = response.json()
+            
+            if SectionParser.json_schema(data) != api['schema']:
+                raise ParsingError("Cached API schema changed")
+            
+            sections = SectionParser(url).parse_json(data)
+            if not sections:
+                raise ParsingError("Cached API returned no content")
+        except Exception as e:
+            logger.info(f"Skill replay failed, falling back to browser: {str(e)}")
+            self._api_cache.pop(url, None)
+            return None
+        
+        logger.info(f"Replayed cached API for {url}: {len(sections)} sections")
+        return ScrapeResult(url=url, meta=dict(api['meta']), sections=sections)
+    
+    def _record_response(self, response: Response, api_responses: List[Response]):
+        """Keep JSON XHR/fetch responses for skill learning"""
+        if response.request.resource_type not in ('xhr', 'fetch') or not response.ok:
+            return
+        if 'json' in response.headers.get('content-type', ''):
+            api_responses.append(response)
+    
+    async def _learn_skill(self, host: str, url: str, meta: Dict[str, str], sections: List[Dict[str, Any]],
+                           content_selector: Optional[str], api_responses: List[Response]):
+        """Store the content selector and the JSON endpoint that best matches the rendered sections"""
+        if content_selector:
+            selectors = self._selector_cache.get(host, [])
+            if content_selector not in selectors:
+                selectors = [content_selector] + selectors
+            self._remember(self._selector_cache, host, selectors)
+        
+        rendered = self._words(sections)
+        if not rendered:
+            return
+        
+        parser = SectionParser(url)
+        best = None
+        best_shared = 0
+        for response in api_responses:
+            try:
+                if response.request.method != 'GET':
+                    continue
+                body = await response.body()
+                if len(body) <= self.MIN_API_BODY:
+                    continue
+                data = await response.json()
+            except Exception:
+                continue
+            
+            # Only an endpoint carrying the page's own content is a usable shortcut;
+            # this skips i18n bundles, feature flags and analytics payloads
+            api_words = self._words(parser.parse_json(data))
+            shared = len(api_words & rendered)
+            if shared < self.MIN_API_OVERLAP * len(api_words) or shared < self.MIN_API_COVERAGE * len(rendered):
+                continue
+            if shared > best_shared:
+                best, best_shared = (response, data), shared
+        
+        if best:
+            response, data = best
+            headers = {
+                k: v for k, v in response.request.headers.items()
+                if not k.startswith(':') and k != 'content-length'
+            }
+            self._remember(self._api_cache, url, {
+                "api": response.url,
+                "headers": headers,
+                "schema": SectionParser.json_schema(data),
+                "meta": meta
+            })
+            logger.info(f"Learned API skill for {url}: {response.url}")
+    
+    def _words(self, sections: List[Dict[str, Any]]) -> Set[str]:
+        """Distinct lowercase words (3+ characters) of the sections' text"""
+        return {word for section in sections for word in self.WORD_RE.findall(section['text'].lower())}
+    
+    async def _settle(self, page: Page, preferred_selectors: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Bring a freshly loaded page to a parseable state: wait for content,
+        give late JS SETTLE_TIMEOUT to run, then remove noise injected meanwhile.
+        Returns the content selector that matched, if any.
+        """
+        content_selector = await self._wait_for_content(page, preferred_selectors)
+        await page.wait_for_timeout(self.SETTLE_TIMEOUT)
+        await self._remove_noise(page)
+        return content_selector
     
-    async def _wait_for_content(self, page: Page):
+    async def _wait_for_content(self, page: Page, preferred_selectors: Optional[List[str]] = None) -> Optional[str]:
         """
         Wait for page content using multiple strategies:
         - Network idle
         - Specific selector presence
-        - Timeout fallback
+        The final SETTLE_TIMEOUT wait is done by _settle.
+        Returns the content selector that matched, if any.
         """
+        found = None
         try:
             # Try waiting for network idle
             await page.wait_for_load_state('networkidle', timeout=10000)
@@ -103,50 +343,37 @@ class JSScraper:
         
         try:
             # Wait for common content selectors
-            content_selectors = ['main', 'article', '[role="main"]', 'body']
+            content_selectors = list(preferred_selectors or [])
+            content_selectors += [s for s in self.CONTENT_SELECTORS if s not in content_selectors]
             
             for selector in content_selectors:
                 try:
                     await page.wait_for_selector(selector, timeout=3000)
                     logger.info(f"Content selector found: {selector}")
+                    found = selector
                     break
                 except Exception:
                     continue
         except Exception:
             logger.info("No specific content selector found, using current state")
         
-        # Additional wait for JS execution
-        await page.wait_for_timeout(2000)
+        return found
     
     async def _remove_noise(self, page: Page):
         """Remove noise elements like cookie banners and modals"""
         try:
-            # JavaScript to remove common noise elements
+            # One query for all selectors; read every computed style before removing
+            # anything so layout is flushed once instead of once per element
             await page.evaluate('''
-                () => {
-                    const selectors = [
-                        '[class*="cookie"]',
-                        '[id*="cookie"]',
-                        '[class*="consent"]',
-                        '[id*="consent"]',
-                        '[class*="gdpr"]',
-                        '[role="dialog"][class*="modal"]',
-                        '[class*="banner"]',
-                        '[class*="popup"]',
-                        '.modal.show',
-                        '[style*="position: fixed"]'
-                    ];
-                    
-                    selectors.forEach(selector => {
-                        document.querySelectorAll(selector).forEach(el => {
-                            const style = window.getComputedStyle(el);
-                            if (style.position === 'fixed' || style.position === 'absolute') {
-                                el.remove();
-                            }
-                        });
+                (selector) => {
+                    const nodes = Array.from(document.querySelectorAll(selector));
+                    const positioned = nodes.filter(el => {
+                        const position = window.getComputedStyle(el).position;
+                        return position === 'fixed' || position === 'absolute';
                     });
+                    positioned.forEach(el => el.remove());
                 }
-            ''')
+            ''', self.NOISE_SELECTOR)
             logger.info("Removed noise elements")
         except Exception as e:
             logger.debug(f"Failed to remove noise: {str(e)}")
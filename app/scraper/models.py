@@ -0,0 +1,21 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass(slots=True)
+class Interactions:
+    """Interactions performed while scraping (none for static pages)"""
+    clicks: List[Dict[str, Any]] = field(default_factory=list)  # {"type", "selector", "text"}
+    scrolls: int = 0
+    pages: List[Dict[str, Any]] = field(default_factory=list)  # {"pageNumber", "url"}
+
+
+@dataclass(slots=True)
+class ScrapeResult:
+    """Scrape result from either scraper; field order matches the JSON response, which orjson serializes directly"""
+    url: str
+    meta: Dict[str, str]
+    sections: List[Dict[str, Any]]
+    interactions: Interactions = field(default_factory=Interactions)
+    errors: List[str] = field(default_factory=list)
+    scrapedAt: Optional[str] = None
@@ -1,60 +1,110 @@
-from bs4 import BeautifulSoup, Tag
-from typing import List, Dict, Any
+from lxml import etree, html as lxml_html
+from lxml.html import HtmlElement
+from typing import List, Dict, Any, Iterator, Optional, Union
+from functools import lru_cache, partial
+from html import escape
 from app.utils.url import make_absolute_url
 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.avif')
+
+
+def parse_html(content: Union[str, bytes], encoding: Optional[str] = None) -> HtmlElement:
+    """Parse an HTML document into an lxml tree; bytes are decoded as encoding when given"""
+    parser = None
+    if encoding and isinstance(content, bytes):
+        try:
+            parser = lxml_html.HTMLParser(encoding=encoding)
+        except LookupError:
+            # Charset label libxml2 doesn't know; UTF-8 is what response.text would fall back to
+            parser = lxml_html.HTMLParser(encoding='utf-8')
+    try:
+        return lxml_html.document_fromstring(content, parser=parser)
+    except ValueError:
+        # lxml rejects str input that carries an XML encoding declaration
+        return lxml_html.document_fromstring(content.encode('utf-8'))
+    except etree.ParserError:
+        # Empty body: parse as an empty page so it reads as insufficient rather than failing
+        return lxml_html.document_fromstring('<html><body></body></html>')
+
 
 class SectionParser:
     """Parse HTML content into structured sections"""
     
     MAX_HTML_LENGTH = 500  # Maximum length for rawHtml snippets
+    MAX_TEXT_LENGTH = 2000  # Maximum length of section text
+    MAX_LINKS = 20
+    MAX_IMAGES = 10
+    MAX_LISTS = 5
+    MAX_TABLES = 3
+    HEADING_TAGS = ('h1', 'h2', 'h3')
+    SKIPPED_TEXT_TAGS = ('script', 'style', 'template')  # Excluded from text, like innerText
+    
+    # XPath expressions are compiled once and evaluated in C
+    _xp_landmarks = etree.XPath('.//header|.//nav|.//main|.//article|.//section|.//aside|.//footer')
+    _xp_headings = etree.XPath('.//h1|.//h2|.//h3')
+    _xp_first_heading = etree.XPath('(.//h1|.//h2|.//h3|.//h4)[1]')
+    # Item/row caps are applied in XPath so capped-away nodes never reach Python
+    _xp_list_items = etree.XPath('./li[position() <= 10]')
+    _xp_table_headers = etree.XPath('.//th')
+    _xp_table_rows = etree.XPath('(.//tr[.//td])[position() <= 10]')
+    _xp_table_cells = etree.XPath('.//td')
+    # Text nodes, skipping script/style bodies the way browsers do for innerText
+    _xp_text = etree.XPath(
+        './/text()[not(ancestor::script or ancestor::style or ancestor::template)]',
+        smart_strings=False
+    )
     
     def __init__(self, base_url: str):
         self.base_url = base_url
+        # base_url is fixed per parser, so memoize on href alone
+        self._absolute_url = lru_cache(maxsize=2048)(partial(make_absolute_url, base_url))
     
-    def parse_sections(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    def parse_sections(self, root: HtmlElement) -> List[Dict[str, Any]]:
         """
         Group content into sections using semantic landmarks and headings
         """
         sections = []
         
         # Try semantic HTML5 landmarks first
-        landmarks = soup.find_all(['header', 'nav', 'main', 'article', 'section', 'aside', 'footer'])
+        landmarks = self._xp_landmarks(root)
         
         if landmarks:
             for idx, landmark in enumerate(landmarks):
-                section = self._parse_section(landmark, f"{landmark.name}-{idx}")
+                section = self._parse_section(landmark, f"{landmark.tag}-{idx}")
                 if section and self._has_meaningful_content(section):
                     sections.append(section)
         
         # If no landmarks or insufficient content, fall back to heading-based sections
         if len(sections) < 2:
-            sections = self._parse_by_headings(soup)
+            sections = self._parse_by_headings(root)
         
-        return sections if sections else self._fallback_section(soup)
+        return sections if sections else self._fallback_section(root)
     
-    def _parse_by_headings(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    def _parse_by_headings(self, root: HtmlElement) -> List[Dict[str, Any]]:
         """Parse content grouped by h1-h3 headings"""
         sections = []
-        headings = soup.find_all(['h1', 'h2', 'h3'])
+        headings = self._xp_headings(root)
         
         for idx, heading in enumerate(headings):
             # Get content until next heading
             content_elements = []
-            for sibling in heading.find_next_siblings():
-                if sibling.name in ['h1', 'h2', 'h3']:
+            for sibling in heading.itersiblings():
+                if not isinstance(sibling.tag, str):
+                    continue  # Skip comments and processing instructions
+                if sibling.tag in self.HEADING_TAGS:
                     break
                 content_elements.append(sibling)
             
             section = {
                 "id": f"section-{idx}",
                 "type": "content",
-                "heading": heading.get_text(strip=True),
+                "heading": self._get_text(heading),
                 "text": self._extract_text(content_elements),
                 "links": self._extract_links(content_elements),
                 "images": self._extract_images(content_elements),
                 "lists": self._extract_lists(content_elements),
                 "tables": self._extract_tables(content_elements),
-                "rawHtml": self._truncate_html(str(heading) + ''.join(str(el) for el in content_elements[:3]))
+                "rawHtml": self._raw_html([heading] + content_elements[:3])
             }
             
             if self._has_meaningful_content(section):
@@ -62,9 +112,11 @@ class SectionParser:
         
         return sections
     
-    def _fallback_section(self, soup: BeautifulSoup) -> List[Dict[str, Any]]:
+    def _fallback_section(self, root: HtmlElement) -> List[Dict[str, Any]]:
         """Create a single fallback section from body content"""
-        body = soup.find('body') or soup
+        body = root if root.tag == 'body' else root.find('.//body')
+        if body is None:
+            body = root
         
         return [{
             "id": "section-0",
@@ -75,14 +127,14 @@ class SectionParser:
             "images": self._extract_images([body]),
             "lists": self._extract_lists([body]),
             "tables": self._extract_tables([body]),
-            "rawHtml": self._truncate_html(str(body))
+            "rawHtml": self._raw_html([body])
         }]
     
-    def _parse_section(self, element: Tag, section_id: str) -> Dict[str, Any]:
+    def _parse_section(self, element: HtmlElement, section_id: str) -> Dict[str, Any]:
         """Parse a single section element"""
         # Find heading
-        heading_tag = element.find(['h1', 'h2', 'h3', 'h4'])
-        heading = heading_tag.get_text(strip=True) if heading_tag else element.name.title()
+        heading_tags = self._xp_first_heading(element)
+        heading = self._get_text(heading_tags[0]) if heading_tags else element.tag.title()
         
         return {
             "id": section_id,
@@ -93,10 +145,10 @@ class SectionParser:
             "images": self._extract_images([element]),
             "lists": self._extract_lists([element]),
             "tables": self._extract_tables([element]),
-            "rawHtml": self._truncate_html(str(element))
+            "rawHtml": self._raw_html([element])
         }
     
-    def _determine_section_type(self, element: Tag) -> str:
+    def _determine_section_type(self, element: HtmlElement) -> str:
         """Determine the type of section based on element"""
         tag_map = {
             'header': 'header',
@@ -106,63 +158,133 @@ class SectionParser:
             'aside': 'sidebar',
             'footer': 'footer'
         }
-        return tag_map.get(element.name, 'content')
+        return tag_map.get(element.tag, 'content')
     
-    def _extract_text(self, elements: List[Tag]) -> str:
-        """Extract clean text from elements"""
+    def _get_text(self, element: HtmlElement, separator: str = '') -> str:
+        """Join the element's stripped, non-empty text nodes with separator"""
+        # Fast path for leaf elements (most link, list item and cell labels):
+        # read .text directly instead of running the text XPath
+        if len(element) == 0 and element.tag not in self.SKIPPED_TEXT_TAGS \
+                and next(element.iterancestors('template'), None) is None:
+            text = element.text
+            return text.strip() if text else ''
+        return separator.join(t for t in (t.strip() for t in self._xp_text(element)) if t)
+    
+    def _to_html(self, element: HtmlElement) -> str:
+        """Serialize an element without its trailing text"""
+        return etree.tostring(element, encoding='unicode', method='html', with_tail=False)
+    
+    def _extract_text(self, elements: List[HtmlElement]) -> str:
+        """Extract clean text from elements, stopping once MAX_TEXT_LENGTH is reached"""
         texts = []
+        length = -1  # Joining n strings adds n - 1 separators
         for el in elements:
-            text = el.get_text(separator=' ', strip=True)
-            if text:
+            for text in self._xp_text(el):
+                text = text.strip()
+                if not text:
+                    continue
                 texts.append(text)
-        return ' '.join(texts)[:2000]  # Limit text length
+                length += len(text) + 1
+                if length >= self.MAX_TEXT_LENGTH:
+                    return ' '.join(texts)[:self.MAX_TEXT_LENGTH]
+        return ' '.join(texts)
     
-    def _extract_links(self, elements: List[Tag]) -> List[Dict[str, str]]:
+    def _extract_links(self, elements: List[HtmlElement]) -> List[Dict[str, str]]:
         """Extract links with text and absolute URLs"""
         links = []
         for el in elements:
-            for a in el.find_all('a', href=True):
-                text = a.get_text(strip=True)
-                href = make_absolute_url(self.base_url, a['href'])
+            for a in el.iterdescendants('a'):
+                href = a.get('href')
+                if href is None:
+                    continue
+                text = self._get_text(a)
+                href = self._absolute_url(href)
                 if text and href:
                     links.append({"text": text, "url": href})
-        return links[:20]  # Limit number of links
+                    if len(links) >= self.MAX_LINKS:
+                        return links
+        return links
     
-    def _extract_images(self, elements: List[Tag]) -> List[Dict[str, str]]:
+    def _extract_images(self, elements: List[HtmlElement]) -> List[Dict[str, str]]:
         """Extract images with src and alt text"""
         images = []
         for el in elements:
-            for img in el.find_all('img', src=True):
-                src = make_absolute_url(self.base_url, img['src'])
-                alt = img.get('alt', '')
-                images.append({"src": src, "alt": alt})
-        return images[:10]  # Limit number of images
+            for img in el.iterdescendants('img'):
+                src = img.get('src')
+                if src is None:
+                    continue
+                images.append({"src": self._absolute_url(src), "alt": img.get('alt', '')})
+                if len(images) >= self.MAX_IMAGES:
+                    return images
+        return images
     
-    def _extract_lists(self, elements: List[Tag]) -> List[List[str]]:
+    def _extract_lists(self, elements: List[HtmlElement]) -> List[List[str]]:
         """Extract list items from ul/ol elements"""
         lists = []
         for el in elements:
-            for ul in el.find_all(['ul', 'ol']):
-                items = [li.get_text(strip=True) for li in ul.find_all('li', recursive=False)]
+            for ul in el.iterdescendants('ul', 'ol'):
+                items = [self._get_text(li) for li in self._xp_list_items(ul)]  # At most 10 items
                 if items:
-                    lists.append(items[:10])  # Limit items per list
-        return lists[:5]  # Limit number of lists
+                    lists.append(items)
+                    if len(lists) >= self.MAX_LISTS:
+                        return lists
+        return lists
     
-    def _extract_tables(self, elements: List[Tag]) -> List[Dict[str, Any]]:
+    def _extract_tables(self, elements: List[HtmlElement]) -> List[Dict[str, Any]]:
         """Extract table data"""
         tables = []
         for el in elements:
-            for table in el.find_all('table'):
-                headers = [th.get_text(strip=True) for th in table.find_all('th')]
-                rows = []
-                for tr in table.find_all('tr'):
-                    cells = [td.get_text(strip=True) for td in tr.find_all('td')]
-                    if cells:
-                        rows.append(cells)
+            for table in el.iterdescendants('table'):
+                headers = [self._get_text(th) for th in self._xp_table_headers(table)]
+                # First 10 rows that have data cells
+                rows = [
+                    [self._get_text(td) for td in self._xp_table_cells(tr)]
+                    for tr in self._xp_table_rows(table)
+                ]
                 
                 if headers or rows:
-                    tables.append({"headers": headers, "rows": rows[:10]})
-        return tables[:3]  # Limit number of tables
+                    tables.append({"headers": headers, "rows": rows})
+                    if len(tables) >= self.MAX_TABLES:
+                        return tables
+        return tables
+    
+    def _raw_html(self, elements: List[HtmlElement]) -> str:
+        """
+        Serialize elements for rawHtml, stopping as soon as the snippet
+        is known to exceed MAX_HTML_LENGTH instead of serializing whole landmarks
+        """
+        parts = []
+        size = 0
+        for element in elements:
+            for chunk in self._iter_html(element):
+                parts.append(chunk)
+                size += len(chunk)
+                if size > self.MAX_HTML_LENGTH:
+                    return self._truncate_html(''.join(parts))
+        return self._truncate_html(''.join(parts))
+    
+    def _iter_html(self, element: HtmlElement) -> Iterator[str]:
+        """Yield the same markup as _to_html(element), one node at a time"""
+        if len(element) == 0 or not isinstance(element.tag, str):
+            yield self._to_html(element)
+            return
+        
+        try:
+            shell = etree.Element(element.tag, dict(element.attrib))
+        except ValueError:
+            # Attribute names lxml can't recreate (e.g. Vue's @click); serialize in one go
+            yield self._to_html(element)
+            return
+        
+        # Start tag and leading text, then each child and its tail, then the end tag
+        shell.text = element.text
+        end_tag = f"</{element.tag}>"
+        yield self._to_html(shell)[:-len(end_tag)]
+        for child in element:
+            yield from self._iter_html(child)
+            if child.tail:
+                yield escape(child.tail, quote=False)
+        yield end_tag
     
     def _truncate_html(self, html: str) -> str:
         """Safely truncate HTML to maximum length"""
@@ -180,7 +302,67 @@ class SectionParser:
             len(section.get('tables', [])) > 0
         )
     
-    def extract_meta(self, soup: BeautifulSoup) -> Dict[str, str]:
+    @staticmethod
+    def json_schema(data: Any) -> List[str]:
+        """Describe the top-level shape of a JSON payload for change detection"""
+        if isinstance(data, list):
+            first = data[0] if data else None
+            return ['[]'] + (sorted(first.keys()) if isinstance(first, dict) else [])
+        if isinstance(data, dict):
+            return sorted(data.keys())
+        return [type(data).__name__]
+    
+    def parse_json(self, data: Any) -> List[Dict[str, Any]]:
+        """Adapt a JSON API payload into the same section structure as HTML"""
+        if isinstance(data, dict):
+            groups = [(str(key), value) for key, value in data.items()]
+        elif isinstance(data, list):
+            groups = [(f"Item {idx + 1}", value) for idx, value in enumerate(data)]
+        else:
+            groups = [("Main Content", data)]
+        
+        sections = []
+        for idx, (heading, value) in enumerate(groups):
+            texts, links, images = [], [], []
+            self._collect_json(value, heading, texts, links, images)
+            section = {
+                "id": f"section-{idx}",
+                "type": "content",
+                "heading": heading,
+                "text": ' '.join(texts)[:self.MAX_TEXT_LENGTH],
+                "links": links[:self.MAX_LINKS],
+                "images": images[:self.MAX_IMAGES],
+                "lists": [],
+                "tables": [],
+                "rawHtml": ""
+            }
+            if self._has_meaningful_content(section):
+                sections.append(section)
+        return sections
+    
+    def _collect_json(self, value: Any, key: str, texts: List[str],
+                      links: List[Dict[str, str]], images: List[Dict[str, str]]):
+        """Recursively gather text, link and image values from JSON"""
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self._collect_json(v, str(k), texts, links, images)
+        elif isinstance(value, list):
+            for item in value:
+                self._collect_json(item, key, texts, links, images)
+        elif isinstance(value, str):
+            text = value.strip()
+            if not text:
+                return
+            if text.startswith(('http://', 'https://', '/')) and ' ' not in text:
+                url = self._absolute_url(text)
+                if text.lower().split('?')[0].endswith(IMAGE_EXTENSIONS):
+                    images.append({"src": url, "alt": key})
+                else:
+                    links.append({"text": key, "url": url})
+            else:
+                texts.append(text)
+    
+    def extract_meta(self, root: HtmlElement) -> Dict[str, str]:
         """Extract meta information from HTML"""
         meta = {
             "title": "",
@@ -190,24 +372,31 @@ class SectionParser:
         }
         
         # Title
-        title_tag = soup.find('title')
-        if title_tag:
-            meta['title'] = title_tag.get_text(strip=True)
+        title_tag = root.find('.//title')
+        if title_tag is not None:
+            meta['title'] = self._get_text(title_tag)
         
         # Meta tags
-        description_tag = soup.find('meta', attrs={'name': 'description'}) or \
-                         soup.find('meta', attrs={'property': 'og:description'})
-        if description_tag and description_tag.get('content'):
-            meta['description'] = description_tag['content']
+        # (lxml elements without children are falsy, so compare against None)
+        description_tag = self._first(root.xpath('.//meta[@name="description"]'))
+        if description_tag is None:
+            description_tag = self._first(root.xpath('.//meta[@property="og:description"]'))
+        if description_tag is not None and description_tag.get('content'):
+            meta['description'] = description_tag.get('content')
         
         # Language
-        html_tag = soup.find('html')
-        if html_tag and html_tag.get('lang'):
-            meta['language'] = html_tag['lang']
+        html_tag = root if root.tag == 'html' else root.find('.//html')
+        if html_tag is not None and html_tag.get('lang'):
+            meta['language'] = html_tag.get('lang')
         
         # Canonical
-        canonical_tag = soup.find('link', attrs={'rel': 'canonical'})
-        if canonical_tag and canonical_tag.get('href'):
-            meta['canonical'] = make_absolute_url(self.base_url, canonical_tag['href'])
+        canonical_tag = self._first(root.xpath('.//link[contains(concat(" ", normalize-space(@rel), " "), " canonical ")]'))
+        if canonical_tag is not None and canonical_tag.get('href'):
+            meta['canonical'] = self._absolute_url(canonical_tag.get('href'))
         
         return meta
+    
+    @staticmethod
+    def _first(elements: List[HtmlElement]) -> Optional[HtmlElement]:
+        """Return the first element of an XPath result, or None"""
+        return elements[0] if elements else None
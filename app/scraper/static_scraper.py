@@ -1,143 +1,219 @@
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import replace
+import asyncio
 import httpx
-from bs4 import BeautifulSoup
-from typing import Dict, Any
+import re
+from lxml import etree
+from lxml.html import HtmlElement
+from typing import Dict, Any, List, Optional, Tuple, Union
 import logging
 
-from app.scraper.section_parser import SectionParser
+from app.scraper.models import ScrapeResult
+from app.scraper.section_parser import SectionParser, parse_html
+from app.utils.dns import caching_transport
 from app.utils.errors import NetworkError, ParsingError
 from app.utils.url import normalize_url
 
 logger = logging.getLogger(__name__)
 
 
+def _parse_worker(html: bytes, url: str, encoding: Optional[str]) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """Strip noise and parse fetched HTML into (meta, sections); module-level so process pools can pickle it"""
+    tree = parse_html(html, encoding)
+    StaticScraper._remove_noise(tree)
+    parser = SectionParser(url)
+    return parser.extract_meta(tree), parser.parse_sections(tree)
+
+
 class StaticScraper:
-    """Static HTML scraper using httpx and BeautifulSoup"""
+    """Static HTML scraper using httpx and lxml"""
     
     TIMEOUT = 30.0
     MIN_TEXT_LENGTH = 200  # Minimum text length to consider scraping sufficient
     MIN_SECTIONS = 1  # Minimum number of sections
+    MAX_BYTES = 10 * 1024 * 1024  # Largest (decompressed) body read before giving up
+    CACHE_SIZE = 1024  # Parsed results kept for conditional re-fetches
     
-    def __init__(self):
-        self.client = httpx.AsyncClient(
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    }
+    # Cookie banners, consent prompts and modals, matched by class/id keyword in one pass
+    NOISE_CLASS_RE = re.compile(r'cookie|consent|gdpr|banner|modal|popup|overlay')
+    NOISE_ID_RE = re.compile(r'cookie|consent|gdpr')
+    POSITIONED_RE = re.compile(r'position\s*:\s*(fixed|absolute)', re.I)
+    # <meta charset> or <meta http-equiv content="...; charset=">, not <script charset> or accept-charset
+    META_CHARSET_RE = re.compile(rb'<meta[^>]+charset', re.I)
+    STRIP_TAGS = ('script', 'style', 'noscript')
+    LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+    
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, parse_pool: Optional[Executor] = None):
+        # Keep one instance per process: connections are only reused through the same client.
+        # The app passes its shared client; standalone use gets an equivalent pooled one.
+        self._owns_client = client is None
+        # Parsing runs off the event loop; None means the loop's default thread pool
+        self.parse_pool = parse_pool
+        # normalized URL -> (etag, last_modified, result), least recently used first
+        self._cache: "OrderedDict[str, Tuple[str, str, ScrapeResult]]" = OrderedDict()
+        self.client = client or httpx.AsyncClient(
+            transport=caching_transport(http1=True, http2=True, limits=self.LIMITS),
             timeout=self.TIMEOUT,
-            follow_redirects=True,
-            headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
+            follow_redirects=True
         )
     
-    async def scrape(self, url: str) -> Dict[str, Any]:
+    async def scrape(self, url: str) -> ScrapeResult:
         """
         Scrape static HTML content from URL
         """
         try:
             normalized_url = normalize_url(url)
-            logger.info(f"Fetching static content from: {normalized_url}")
-            
-            # Fetch HTML
-            response = await self.client.get(normalized_url)
-            response.raise_for_status()
-            html_content = response.text
+            logger.info("Fetching static content from: %s", normalized_url)
             
-            # Parse HTML
-            soup = BeautifulSoup(html_content, 'lxml')
+            # Revalidate a previously parsed page rather than downloading it again
+            headers = self.HEADERS
+            cached = self._cache.get(normalized_url)
+            if cached is not None:
+                etag, last_modified, _ = cached
+                headers = dict(self.HEADERS)
+                if etag:
+                    headers['If-None-Match'] = etag
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified
             
-            # Remove noise elements
-            self._remove_noise(soup)
+            # Fetch HTML, streaming so an oversized body is abandoned instead of buffered
+            async with self.client.stream(
+                'GET',
+                normalized_url,
+                headers=headers,
+                timeout=self.TIMEOUT,
+                follow_redirects=True
+            ) as response:
+                if response.status_code == 304 and cached is not None:
+                    logger.info("Not modified, reusing cached result for: %s", normalized_url)
+                    self._cache.move_to_end(normalized_url)
+                    # Shallow copy: callers set top-level fields such as scrapedAt
+                    return replace(cached[2])
+                response.raise_for_status()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Content-Encoding: %s", response.headers.get('content-encoding', 'identity'))
+                # Raw bytes: lxml decodes them itself, skipping httpx's decode and charset guessing
+                chunks = []
+                total = 0
+                async for chunk in response.aiter_bytes():
+                    total += len(chunk)
+                    if total > self.MAX_BYTES:
+                        logger.error("Response exceeded %d bytes", self.MAX_BYTES)
+                        raise NetworkError("Response too large")
+                    chunks.append(chunk)
+                encoding = response.charset_encoding
+                etag = response.headers.get('etag', '')
+                last_modified = response.headers.get('last-modified', '')
+            html_content = b''.join(chunks)
+            if encoding is None and not self.META_CHARSET_RE.search(html_content[:1024]):
+                # No <meta charset> in the prescan window; assume UTF-8 as response.text would
+                encoding = 'utf-8'
             
-            # Initialize parser
-            parser = SectionParser(normalized_url)
+            # Parse HTML, remove noise and extract meta and sections
+            loop = asyncio.get_running_loop()
+            meta, sections = await loop.run_in_executor(
+                self.parse_pool, _parse_worker, html_content, normalized_url, encoding
+            )
             
-            # Extract meta and sections
-            meta = parser.extract_meta(soup)
-            sections = parser.parse_sections(soup)
+            result = ScrapeResult(url=normalized_url, meta=meta, sections=sections)
             
-            result = {
-                "url": normalized_url,
-                "meta": meta,
-                "sections": sections,
-                "interactions": {
-                    "clicks": [],
-                    "scrolls": 0,
-                    "pages": []
-                },
-                "errors": []
-            }
+            if etag or last_modified:
+                self._cache[normalized_url] = (etag, last_modified, result)
+                self._cache.move_to_end(normalized_url)
+                if len(self._cache) > self.CACHE_SIZE:
+                    self._cache.popitem(last=False)
             
-            logger.info(f"Static scraping completed: {len(sections)} sections found")
-            return result
+            logger.info("Static scraping completed: %d sections found", len(sections))
+            return replace(result)
             
+        except NetworkError:
+            raise
         except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error: {e.response.status_code}")
+            logger.error("HTTP error: %s", e.response.status_code)
             raise NetworkError(f"HTTP {e.response.status_code}: {str(e)}")
         except httpx.RequestError as e:
-            logger.error(f"Request error: {str(e)}")
+            logger.error("Request error: %s", e)
             raise NetworkError(f"Network error: {str(e)}")
         except Exception as e:
-            logger.error(f"Parsing error: {str(e)}")
+            logger.error("Parsing error: %s", e)
             raise ParsingError(f"Failed to parse HTML: {str(e)}")
     
-    def _remove_noise(self, soup: BeautifulSoup):
+    async def scrape_many(self, urls: List[str], concurrency: int = 20) -> List[Union[ScrapeResult, Exception]]:
+        """
+        Scrape several URLs concurrently, at most `concurrency` in flight.
+        Results are in input order; failed URLs yield their exception.
+        """
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        sem = asyncio.BoundedSemaphore(concurrency)
+        
+        async def _one(url: str) -> ScrapeResult:
+            async with sem:
+                return await self.scrape(url)
+        
+        return await asyncio.gather(*[_one(url) for url in urls], return_exceptions=True)
+    
+    @classmethod
+    def _remove_noise(cls, tree: HtmlElement):
         """Remove common noise elements like cookie banners and modals"""
-        # Remove cookie consent banners
-        noise_selectors = [
-            '[class*="cookie"]',
-            '[id*="cookie"]',
-            '[class*="consent"]',
-            '[id*="consent"]',
-            '[class*="gdpr"]',
-            '[id*="gdpr"]',
-            '[class*="banner"]',
-            '[role="dialog"]',
-            '[class*="modal"]',
-            '[class*="popup"]',
-            '[class*="overlay"]'
-        ]
+        class_match = cls.NOISE_CLASS_RE.search
+        id_match = cls.NOISE_ID_RE.search
+        candidates = []
+        for element in tree.iter(etree.Element):
+            class_name = element.get('class')
+            element_id = element.get('id')
+            if ((class_name and class_match(class_name))
+                    or (element_id and id_match(element_id))
+                    or element.get('role') == 'dialog'):
+                candidates.append(element)
         
-        for selector in noise_selectors:
-            for element in soup.select(selector):
-                # Only remove if it's likely a banner/modal (positioned fixed/absolute)
-                style = element.get('style', '')
-                if 'fixed' in style or 'absolute' in style or element.name in ['dialog']:
-                    element.decompose()
+        positioned = cls.POSITIONED_RE.search
+        for element in candidates:
+            # Only remove if it's likely a banner/modal: a dialog, or positioned fixed/absolute
+            if (element.tag == 'dialog'
+                    or element.get('role') == 'dialog'
+                    or positioned(element.get('style') or '')):
+                if element.getparent() is not None:
+                    element.drop_tree()
         
         # Remove script and style tags
-        for tag in soup(['script', 'style', 'noscript']):
-            tag.decompose()
+        etree.strip_elements(tree, *cls.STRIP_TAGS, with_tail=False)
     
-    def is_sufficient(self, result: Dict[str, Any]) -> bool:
+    def is_sufficient(self, result: ScrapeResult) -> bool:
         """
         Determine if static scraping produced sufficient content.
         Returns False if JS rendering is needed.
         """
-        sections = result.get('sections', [])
+        sections = result.sections
         
         # Check if we have minimum sections
         if len(sections) < self.MIN_SECTIONS:
             logger.info("Insufficient sections found")
             return False
         
-        # Calculate total text length
-        total_text = sum(len(section.get('text', '')) for section in sections)
+        # One pass: stop as soon as both thresholds are met
+        total_text = 0
+        has_content = False
+        for section in sections:
+            text = section.get('text', '')
+            total_text += len(text)
+            if not has_content:
+                has_content = bool(text or section.get('links') or section.get('images'))
+            if has_content and total_text >= self.MIN_TEXT_LENGTH:
+                return True
         
         if total_text < self.MIN_TEXT_LENGTH:
-            logger.info(f"Insufficient text content: {total_text} chars")
-            return False
-        
-        # Check if we have any meaningful content
-        has_content = any(
-            section.get('text') or 
-            section.get('links') or 
-            section.get('images')
-            for section in sections
-        )
-        
-        if not has_content:
-            logger.info("No meaningful content found")
+            logger.info("Insufficient text content: %d chars", total_text)
             return False
         
-        return True
+        logger.info("No meaningful content found")
+        return False
     
     async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
+        """Close the HTTP client if this scraper created it"""
+        if self._owns_client:
+            await self.client.aclose()
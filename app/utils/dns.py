@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from itertools import chain, zip_longest
+from typing import Iterable, List, Optional, Set, Tuple
+import asyncio
+import socket
+import time
+
+import httpcore
+import httpx
+
+
+class CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    httpcore network backend that remembers resolved addresses for a while.
+    Entries live for a fixed ttl (300s by default), not the record's own TTL,
+    which getaddrinfo doesn't report; a host whose addresses all fail is re-resolved.
+    """
+
+    HAPPY_EYEBALLS_DELAY = 0.25  # Seconds before racing the next address (RFC 8305, as anyio does)
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend, ttl: float = 300.0, maxsize: int = 10_000):
+        self._backend = backend
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # (host, port) -> (expires_at, addresses), oldest first
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[str]]]" = OrderedDict()
+
+    async def _resolve(self, host: str, port: int, timeout: Optional[float]) -> Tuple[List[str], bool]:
+        """Return the addresses for host and whether they came from the cache, resolving on a miss"""
+        key = (host, port)
+        now = time.monotonic()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] > now:
+            self._cache.move_to_end(key)
+            return entry[1], True
+
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout
+            )
+        except asyncio.TimeoutError:
+            raise httpcore.ConnectTimeout(f"DNS lookup for {host} timed out")
+        except OSError as e:
+            raise httpcore.ConnectError(str(e))
+
+        # Deduplicate in resolver order, then alternate address families so a dead
+        # IPv6 (or IPv4) route only delays the other family by one stagger
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        first_family = [a for a in addresses if (':' in a) == (':' in addresses[0])]
+        other_family = [a for a in addresses if (':' in a) != (':' in addresses[0])]
+        addresses = [a for a in chain.from_iterable(zip_longest(first_family, other_family)) if a]
+
+        self._cache[key] = (now + self.ttl, addresses)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return addresses, False
+
+    async def _connect_first(
+        self,
+        addresses: List[str],
+        port: int,
+        timeout: Optional[float],
+        local_address: Optional[str],
+        socket_options: Optional[Iterable],
+    ) -> httpcore.AsyncNetworkStream:
+        """
+        Happy eyeballs: start the next address every HAPPY_EYEBALLS_DELAY seconds, or as soon as
+        an attempt fails, and keep the first connection that succeeds
+        """
+        remaining = list(addresses)
+        pending: Set[asyncio.Task] = set()
+        last_error: Optional[Exception] = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    pending.add(asyncio.ensure_future(
+                        self._backend.connect_tcp(remaining.pop(0), port, timeout, local_address, socket_options)
+                    ))
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=self.HAPPY_EYEBALLS_DELAY if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                streams = []
+                for task in done:
+                    try:
+                        streams.append(task.result())
+                    except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                        last_error = e
+                if streams:
+                    for extra in streams[1:]:
+                        await extra.aclose()
+                    return streams[0]
+        finally:
+            # Stop the losing attempts; close any that connected before the cancel landed
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if isinstance(result, httpcore.AsyncNetworkStream):
+                    await result.aclose()
+
+        raise last_error or httpcore.ConnectError("No addresses to connect to")
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: Optional[float] = None,
+        local_address: Optional[str] = None,
+        socket_options: Optional[Iterable] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        addresses, cached = await self._resolve(host, port, timeout)
+        try:
+            return await self._connect_first(addresses, port, timeout, local_address, socket_options)
+        except (httpcore.ConnectError, httpcore.ConnectTimeout):
+            # Every address failed; forget them so the next lookup starts fresh
+            self._cache.pop((host, port), None)
+            if not cached:
+                raise
+        # The cached addresses may be stale; let the backend resolve afresh
+        return await self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: Optional[float] = None,
+        socket_options: Optional[Iterable] = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def caching_transport(**kwargs) -> httpx.AsyncHTTPTransport:
+    """httpx transport (same arguments as AsyncHTTPTransport) whose connections reuse cached DNS lookups"""
+    transport = httpx.AsyncHTTPTransport(**kwargs)
+    # httpx doesn't expose httpcore's network_backend option, so wrap the one its pool built.
+    # This relies on private attributes; httpcore is pinned and tests/test_dns.py guards it.
+    pool = transport._pool
+    pool._network_backend = CachingNetworkBackend(pool._network_backend)
+    return transport
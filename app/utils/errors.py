@@ -1,18 +1,18 @@
 class ScraperError(Exception):
     """Base exception for scraper errors"""
-    pass
+    __slots__ = ()
 
 
 class NetworkError(ScraperError):
     """Network-related errors"""
-    pass
+    __slots__ = ()
 
 
 class ParsingError(ScraperError):
     """HTML parsing errors"""
-    pass
+    __slots__ = ()
 
 
 class JSRenderError(ScraperError):
     """JavaScript rendering errors"""
-    pass
+    __slots__ = ()
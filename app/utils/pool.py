@@ -0,0 +1,38 @@
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class RestartingProcessPool(Executor):
+    """
+    ProcessPoolExecutor that starts a fresh pool once a worker has died.
+    A plain pool stays broken after one crash (e.g. an OOM kill), failing every later job;
+    here only the jobs running at the time fail.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, mp_context: Any = None):
+        self._max_workers = max_workers
+        self._mp_context = mp_context
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self._max_workers, mp_context=self._mp_context)
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        with self._lock:
+            try:
+                return self._pool.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                logger.warning("Parse pool lost a worker; starting a new pool")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                return self._pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._lock:
+            self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
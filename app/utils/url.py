@@ -1,6 +1,8 @@
-from urllib.parse import urljoin, urlparse
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse, urlsplit
 
 
+@lru_cache(maxsize=100_000)
 def is_valid_url(url: str) -> bool:
     """Check if URL is valid and uses http/https scheme"""
     try:
@@ -10,6 +12,7 @@ def is_valid_url(url: str) -> bool:
         return False
 
 
+@lru_cache(maxsize=4096)
 def make_absolute_url(base_url: str, relative_url: str) -> str:
     """Convert relative URL to absolute URL"""
     if not relative_url:
@@ -17,11 +20,7 @@ def make_absolute_url(base_url: str, relative_url: str) -> str:
     return urljoin(base_url, relative_url)
 
 
+@lru_cache(maxsize=100_000)
 def normalize_url(url: str) -> str:
     """Normalize URL by removing fragments and ensuring proper format"""
-    parsed = urlparse(url)
-    # Remove fragment
-    normalized = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-    if parsed.query:
-        normalized += f"?{parsed.query}"
-    return normalized
+    return urlsplit(url)._replace(fragment='').geturl()
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpcore
+import httpx
+
+from app.utils.dns import CachingNetworkBackend, caching_transport
+
+
+def test_transport_pool_exposes_network_backend():
+    # caching_transport patches this private attribute; fail loudly if httpx/httpcore move it
+    pool = httpx.AsyncHTTPTransport()._pool
+    assert isinstance(pool._network_backend, httpcore.AsyncNetworkBackend)
+
+
+def test_caching_transport_wraps_backend():
+    backend = caching_transport()._pool._network_backend
+    assert isinstance(backend, CachingNetworkBackend)
+
+
+class FakeBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self, failures):
+        self.failures = failures
+        self.attempts = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.attempts.append(host)
+        if host in self.failures:
+            raise self.failures[host]
+        return host
+
+
+def test_connect_tries_each_cached_address():
+    fake = FakeBackend({"10.0.0.1": httpcore.ConnectTimeout("slow"), "10.0.0.2": httpcore.ConnectError("down")})
+    backend = CachingNetworkBackend(fake)
+    backend._cache[("example.com", 80)] = (float("inf"), ["10.0.0.1", "10.0.0.2", "10.0.0.3"])
+
+    assert asyncio.run(backend.connect_tcp("example.com", 80)) == "10.0.0.3"
+    assert fake.attempts == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+
+class HangingBackend(FakeBackend):
+    def __init__(self, hanging, failures=None):
+        super().__init__(failures or {})
+        self.hanging = hanging
+        self.cancelled = []
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if host in self.hanging:
+            self.attempts.append(host)
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                self.cancelled.append(host)
+                raise
+        return await super().connect_tcp(host, port, timeout, local_address, socket_options)
+
+
+def test_blackholed_address_only_delays_the_next_by_the_stagger():
+    fake = HangingBackend({"2001:db8::1"})
+    backend = CachingNetworkBackend(fake)
+    backend._cache[("example.com", 443)] = (float("inf"), ["2001:db8::1", "10.0.0.1"])
+
+    started = time.monotonic()
+    assert asyncio.run(backend.connect_tcp("example.com", 443, timeout=30)) == "10.0.0.1"
+    assert time.monotonic() - started < 1
+    assert fake.cancelled == ["2001:db8::1"]
+
+
+def test_resolved_addresses_alternate_families():
+    async def run():
+        backend = CachingNetworkBackend(FakeBackend({}))
+        loop = asyncio.get_running_loop()
+
+        async def getaddrinfo(host, port, type=0):
+            return [(None, None, None, '', (address, port)) for address in ("::1", "::2", "10.0.0.1", "::1")]
+        loop.getaddrinfo = getaddrinfo
+        return await backend._resolve("example.com", 80, None)
+
+    assert asyncio.run(run()) == (["::1", "10.0.0.1", "::2"], False)
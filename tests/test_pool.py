@@ -0,0 +1,17 @@
+import multiprocessing
+import os
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from app.utils.pool import RestartingProcessPool
+
+
+def test_pool_recovers_after_worker_dies():
+    pool = RestartingProcessPool(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result(timeout=30)
+        assert pool.submit(pow, 2, 10).result(timeout=30) == 1024
+    finally:
+        pool.shutdown()
@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+from app.scraper.static_scraper import StaticScraper
+
+
+def scrape_body(body: bytes):
+    async def run():
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, headers={'content-type': 'text/html'}, content=body)
+        )
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await StaticScraper(client=client).scrape('https://example.com/')
+    return asyncio.run(run())
+
+
+def section_text(result) -> str:
+    return ' '.join(section['text'] for section in result.sections)
+
+
+def test_script_charset_does_not_disable_utf8_default():
+    body = ('<html><head><script charset="utf-8" src="/a.js"></script></head>'
+            '<body><main><p>café ünï Zürich</p></main></body></html>').encode()
+    assert 'café ünï Zürich' in section_text(scrape_body(body))
+
+
+def test_meta_charset_is_honoured():
+    body = ('<html><head><meta charset="shift_jis"></head>'
+            '<body><main><p>日本語のテキスト</p></main></body></html>').encode('shift_jis')
+    assert '日本語のテキスト' in section_text(scrape_body(body))